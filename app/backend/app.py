@@ -8,15 +8,17 @@ The application includes:
 - A WebSocket endpoint to stream new logs from Redis in real-time.
 
 The Redis connection is established using managed identity for secure access.
+Usage records are decoded with `shared_code.usage_codec` from the function app,
+so `src` must be on the PYTHONPATH when running the backend.
 """
 
-import json
 import os
 import logging
 from quart import Quart, jsonify, websocket, render_template, request
 import redis.asyncio as redis
 from azure.identity.aio import DefaultAzureCredential
 from azure.mgmt.redis.aio import RedisManagementClient
+from shared_code.usage_codec import decode_usage
 #from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -54,8 +56,7 @@ class RedisClientManager:
 
                 cls._redis_client = redis.from_url(
                     f"rediss://{redis_host}:6380",
-                    password=primary_key,
-                    decode_responses=True
+                    password=primary_key
                 )
                 logging.info("Successfully connected to Redis using Managed Identity")
             except Exception as e:
@@ -145,10 +146,10 @@ async def get_logs():
             log = await redis_client.get(key)  # Fetch log data for each key
             if log:
                 try:
-                    log_data = json.loads(log)  # Convert string data back to dict
+                    log_data = decode_usage(key, log)  # Convert stored record back to dict
                     log_data["totalCost"] = f"{calculate_chargeback(log_data):.2f}"  # Format total cost
                     processed_logs.append(log_data)
-                except json.JSONDecodeError as e:
+                except ValueError as e:
                     logging.error(f"Failed to decode log for key {key}: {e}")
 
         # Return JSON response
@@ -173,7 +174,7 @@ async def get_chargeback():
         processed_logs = []
         for key in keys:
             log = await redis_client.get(key)  # Fetch log data for each key
-            log_data = json.loads(log)  # Convert string data back to dict
+            log_data = decode_usage(key, log)  # Convert stored record back to dict
             total_chargeback += calculate_chargeback(log_data)
             log_data["totalCost"] = f"{calculate_chargeback(log_data):.2f}"  # Format total cost
             processed_logs.append(log_data)
@@ -195,6 +196,6 @@ async def logs_websocket():
     redis_client = await RedisClientManager.get_redis_client()
     while True:
         log = await redis_client.brpop("logs")  # Blocking call to wait for a new log
-        await websocket.send(log[1])  # Send log data to frontend
+        await websocket.send(log[1].decode("utf-8"))  # Send log data to frontend
 
 
@@ -0,0 +1,84 @@
+"""
+Benchmark the compact usage record encoding against the legacy JSON values.
+
+Reports the value bytes saved per million Redis keys and the time saved
+decoding a `/logs` sweep over the same number of keys. When `--redis-url`
+is given, the Redis-reported `MEMORY USAGE` of both value formats is
+measured as well (this writes and then deletes two scratch keys).
+
+Usage:
+    python scripts/bench_usage_codec.py [--keys 1000000] [--redis-url redis://localhost:6379]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from shared_code.usage_codec import decode_usage, encode_usage, make_cache_key  # noqa: E402
+
+SAMPLE_RECORD = {
+    "subscriptionId": "3f2b9c1e-8d4a-4b7e-9a61-0c5d2e7f4a18",
+    "deploymentId": "gpt-35-turbo-instruct",
+    "model": "gpt-35-turbo-instruct",
+    "object": "chat.completion",
+    "completionTokens": 123456,
+    "promptTokens": 654321,
+    "totalTokens": 777777,
+}
+
+
+def time_decode(decode, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        decode()
+    return time.perf_counter() - start
+
+
+def redis_memory_usage(redis_url, key, json_value, packed_value):
+    import redis
+
+    client = redis.Redis.from_url(redis_url)
+    json_key, packed_key = f"bench-json:{key}", f"bench-packed:{key}"
+    try:
+        client.set(json_key, json_value)
+        client.set(packed_key, packed_value)
+        return client.memory_usage(json_key), client.memory_usage(packed_key)
+    finally:
+        client.delete(json_key, packed_key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--keys", type=int, default=1_000_000, help="number of keys to model")
+    parser.add_argument("--redis-url", help="measure MEMORY USAGE against this Redis instance")
+    args = parser.parse_args()
+
+    key = make_cache_key(SAMPLE_RECORD["subscriptionId"], SAMPLE_RECORD["deploymentId"])
+    json_value = json.dumps(SAMPLE_RECORD).encode("utf-8")
+    packed_value = encode_usage(SAMPLE_RECORD)
+    assert decode_usage(key, packed_value) == SAMPLE_RECORD
+
+    per_million = 1_000_000
+    print(f"JSON value:   {len(json_value)} bytes")
+    print(f"Packed value: {len(packed_value)} bytes")
+    print(f"Value bytes saved per million keys: "
+          f"{(len(json_value) - len(packed_value)) * per_million / 2**20:.1f} MiB")
+
+    if args.redis_url:
+        json_usage, packed_usage = redis_memory_usage(args.redis_url, key, json_value, packed_value)
+        print(f"Redis MEMORY USAGE: JSON {json_usage} bytes, packed {packed_usage} bytes")
+        print(f"Redis memory saved per million keys: "
+              f"{(json_usage - packed_usage) * per_million / 2**20:.1f} MiB")
+
+    json_seconds = time_decode(lambda: json.loads(json_value), args.keys)
+    packed_seconds = time_decode(lambda: decode_usage(key, packed_value), args.keys)
+    print(f"Decode {args.keys} keys: JSON {json_seconds:.3f}s, packed {packed_seconds:.3f}s, "
+          f"saved {json_seconds - packed_seconds:.3f}s per /logs sweep")
+
+
+if __name__ == "__main__":
+    main()
@@ -532,7 +532,13 @@ try {
 
 # Build and push backend Docker image
 Write-Host "Building and pushing backend Docker image..." -ForegroundColor Cyan
+# The backend decodes usage records with the codec shared with the Function App,
+# so copy it into the build context
+$sharedCodePath = Join-Path -Path $scriptPath -ChildPath "../src/shared_code"
+$backendSharedCodePath = Join-Path -Path $backendFolderPath -ChildPath "shared_code"
 try {
+    Remove-Item -Path $backendSharedCodePath -Recurse -Force -ErrorAction SilentlyContinue
+    Copy-Item -Path $sharedCodePath -Destination $backendSharedCodePath -Recurse -Force
     Push-Location $backendFolderPath
     $backendImage = "$ContainerRegistryName.azurecr.io/${BackendImageName}:${ImageTag}"
     Write-Host "Building image: $backendImage" -ForegroundColor Yellow
@@ -545,6 +551,7 @@ try {
     exit 1
 } finally {
     Pop-Location
+    Remove-Item -Path $backendSharedCodePath -Recurse -Force -ErrorAction SilentlyContinue
 }
 
 # Build and push frontend Docker image
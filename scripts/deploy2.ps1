@@ -29,7 +29,17 @@ if (-not (Test-Path $backendFolderPath)) {
     Write-Host "Backend folder not found at $backendFolderPath. Please ensure it exists." -ForegroundColor Red
     exit 1
 }
-Compress-FolderContent -sourceFolder $backendFolderPath -destinationZip $backendZipPath
+# The backend decodes usage records with the codec shared with the Function App,
+# so copy it into the backend folder before zipping
+$sharedCodePath = Join-Path -Path $scriptPath -ChildPath "../src/shared_code"
+$backendSharedCodePath = Join-Path -Path $backendFolderPath -ChildPath "shared_code"
+Remove-Item -Path $backendSharedCodePath -Recurse -Force -ErrorAction SilentlyContinue
+Copy-Item -Path $sharedCodePath -Destination $backendSharedCodePath -Recurse -Force
+try {
+    Compress-FolderContent -sourceFolder $backendFolderPath -destinationZip $backendZipPath
+} finally {
+    Remove-Item -Path $backendSharedCodePath -Recurse -Force -ErrorAction SilentlyContinue
+}
 Write-Host "Backend code zipped successfully."
 
 # Zip frontend code
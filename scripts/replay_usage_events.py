@@ -0,0 +1,232 @@
+"""
+Rebuild the Redis usage counters from recorded usage events.
+
+Use this when counters were lost to TTL expiry, a Redis failover or a pricing
+change. Each input line is one JSON log payload as APIM sends it to the
+`process_logs` function, and is parsed with the same logic. Inputs are
+streamed in chunks (plain or `.gz` NDJSON files, or `-` for stdin), so memory
+stays bounded by the number of distinct keys rather than the number of events.
+Chunks are aggregated in parallel in a process pool, then written to Redis
+with pipelines in the function's compact encoding.
+
+With `--mode replace` (the default) the rebuilt totals overwrite existing
+counters. With `--mode increment` they are added to them. Both this tool and
+`process_logs` update counters in WATCH/MULTI transactions, so increment
+mode can run while `process_logs` is still taking traffic without either
+side losing an increment.
+Lines that fail to parse, and keys whose existing or rebuilt value fails
+to decode or encode, are counted and skipped instead of aborting the run.
+
+Usage:
+    python scripts/replay_usage_events.py events.ndjson.gz --redis-url rediss://:<key>@<host>:6380
+    python scripts/replay_usage_events.py events.ndjson --dry-run
+"""
+
+import argparse
+import collections
+import gzip
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from shared_code.usage_codec import decode_usage, encode_usage, make_cache_key  # noqa: E402
+from shared_code.usage_parser import TOKEN_FIELDS, parse_usage_payload  # noqa: E402
+
+
+def read_lines(paths):
+    """Yield raw lines from each NDJSON input, one at a time."""
+    for path in paths:
+        if path == "-":
+            yield from sys.stdin.buffer
+        else:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rb") as f:
+                yield from f
+
+
+def chunked(lines, size):
+    """Group an iterable of lines into lists of at most `size` lines."""
+    while True:
+        chunk = list(itertools.islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def merge_record(aggregates, log_data):
+    """Add a usage record into `aggregates`, keyed by cache key."""
+    key = make_cache_key(log_data["subscriptionId"], log_data["deploymentId"])
+    existing = aggregates.get(key)
+    if existing is None:
+        aggregates[key] = dict(log_data)
+        return
+    # Like the live function, the most recent model and object win.
+    existing["model"] = log_data["model"]
+    existing["object"] = log_data["object"]
+    for field in TOKEN_FIELDS:
+        existing[field] += log_data[field]
+
+
+def aggregate_chunk(lines):
+    """Parse and aggregate one chunk of lines; runs in a worker process."""
+    aggregates = {}
+    events = invalid = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        events += 1
+        try:
+            log_data, error_message = parse_usage_payload(json.loads(line))
+            if error_message:
+                invalid += 1
+                continue
+            merge_record(aggregates, log_data)
+        except (ValueError, AttributeError, TypeError):
+            invalid += 1
+    return aggregates, events, invalid
+
+
+def aggregate_events(paths, workers, chunk_size):
+    """
+    Aggregate all events across a process pool.
+
+    At most two chunks per worker are in flight at once, so input is never
+    read faster than it can be processed.
+    """
+    totals = {}
+    events = invalid = 0
+    pending = collections.deque()
+    chunks = chunked(read_lines(paths), chunk_size)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is not None:
+                pending.append(executor.submit(aggregate_chunk, chunk))
+                if len(pending) < workers * 2:
+                    continue
+            while pending and (chunk is None or len(pending) >= workers * 2):
+                aggregates, chunk_events, chunk_invalid = pending.popleft().result()
+                for log_data in aggregates.values():
+                    merge_record(totals, log_data)
+                events += chunk_events
+                invalid += chunk_invalid
+
+    return totals, events, invalid
+
+
+def increment_batch(redis_client, batch, ttl):
+    """
+    Add one batch of counters to the values already in Redis.
+
+    The read and the write happen in a WATCH/MULTI transaction that is
+    retried if a live `process_logs` write touches any of the keys in
+    between. `process_logs` writes the same way, so neither side can
+    overwrite the other's increment. Keys whose existing value cannot be
+    decoded or re-encoded are left untouched and returned.
+    """
+    keys = [key for key, _ in batch]
+    skipped = []
+
+    def apply(pipe):
+        skipped.clear()
+        updates = []
+        for (key, log_data), existing_value in zip(batch, pipe.mget(keys)):
+            try:
+                merged = dict(log_data)
+                if existing_value:
+                    existing_data = decode_usage(key, existing_value)
+                    for field in TOKEN_FIELDS:
+                        merged[field] += existing_data.get(field, 0)
+                updates.append((key, encode_usage(merged)))
+            except (ValueError, AttributeError, TypeError) as e:
+                logging.warning("Skipping key %s: %s", key, e)
+                skipped.append(key)
+        pipe.multi()
+        for key, value in updates:
+            pipe.set(key, value, ex=ttl or None)
+
+    redis_client.transaction(apply, *keys)
+    return skipped
+
+
+def load_into_redis(redis_client, totals, mode, ttl, pipeline_size):
+    """
+    Write the aggregated counters to Redis in pipelined batches.
+
+    Returns the number of keys written and the number skipped.
+    """
+    items = iter(totals.items())
+    written = skipped = 0
+    while True:
+        batch = list(itertools.islice(items, pipeline_size))
+        if not batch:
+            return written, skipped
+
+        if mode == "increment":
+            batch_skipped = len(increment_batch(redis_client, batch, ttl))
+            written += len(batch) - batch_skipped
+            skipped += batch_skipped
+            continue
+
+        pipe = redis_client.pipeline(transaction=False)
+        for key, log_data in batch:
+            try:
+                value = encode_usage(log_data)
+            except (ValueError, AttributeError, TypeError) as e:
+                logging.warning("Skipping key %s: %s", key, e)
+                skipped += 1
+                continue
+            pipe.set(key, value, ex=ttl or None)
+            written += 1
+        pipe.execute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="NDJSON event logs (.gz supported, - for stdin)")
+    parser.add_argument("--redis-url", default=os.environ.get("REDIS_URL"),
+                        help="target Redis instance (default: $REDIS_URL)")
+    parser.add_argument("--mode", choices=("replace", "increment"), default="replace",
+                        help="overwrite existing counters or add to them")
+    parser.add_argument("--ttl", type=int, default=86400,
+                        help="key TTL in seconds, 0 for no expiry (default: 86400)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=20_000, help="lines per worker task")
+    parser.add_argument("--pipeline-size", type=int, default=1_000, help="keys per Redis pipeline")
+    parser.add_argument("--dry-run", action="store_true", help="aggregate only, do not write to Redis")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if not args.dry_run and not args.redis_url:
+        parser.error("--redis-url or $REDIS_URL is required unless --dry-run is given")
+
+    started = time.perf_counter()
+    totals, events, invalid = aggregate_events(args.paths, args.workers, args.chunk_size)
+    elapsed = time.perf_counter() - started
+    rate = events / elapsed * 60 if elapsed else 0
+    logging.info("Aggregated %d events (%d invalid) into %d keys in %.1fs (%.0f events/min)",
+                 events, invalid, len(totals), elapsed, rate)
+
+    if args.dry_run:
+        for key, log_data in sorted(totals.items()):
+            print(json.dumps({"key": key, **log_data}))
+        return
+
+    import redis
+
+    redis_client = redis.Redis.from_url(args.redis_url)
+    started = time.perf_counter()
+    written, skipped = load_into_redis(redis_client, totals, args.mode, args.ttl, args.pipeline_size)
+    logging.info("Wrote %d keys to Redis (%s, %d skipped) in %.1fs", written, args.mode, skipped,
+                 time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,18 +5,30 @@ This function is triggered by HTTP request hitting the APIM, recieves
 the HTTP request with log data, processes the data, and stores it in Redis
 for 24 hours. If there is existing data for the same composite subscription
 and deployment key, it updates the existing data with an increment of the new
-values.
+values. Records are stored in the compact binary layout defined in
+`shared_code.usage_codec`.
 
-The function also logs the stored data to the function app's log stream.
+Request and response sizes are aggregated into histograms and emitted
+periodically, and a sampled subset of requests is logged as structured
+events by `shared_code.request_logging`. Request bodies are never logged.
 """
 
+import atexit
 import logging
 import json
 import os
+import time
 import redis
 from azure.identity import DefaultAzureCredential
 from azure.mgmt.redis import RedisManagementClient
 import azure.functions as func
+from shared_code.request_logging import RequestLogger
+from shared_code.usage_codec import decode_usage, encode_usage, make_cache_key
+from shared_code.usage_parser import TOKEN_FIELDS, parse_usage_payload
+
+request_logger = RequestLogger.from_env()
+# Emit the last interval's histograms when the worker shuts down or scales in.
+atexit.register(request_logger.flush)
 
 def get_redis_client():
     """Initialize Redis connection using Managed Identity."""
@@ -49,106 +61,90 @@ def get_redis_client():
 
 def parse_request(req):
     """Parse the HTTP request and extract necessary fields."""
+    # Rejections are logged at DEBUG only; the rate-limited request events
+    # emitted by `main` already report them.
     try:
-        # req_body = req.get_json()
-        # logging.info("Request payload: %s", json.dumps(req_body, indent=2))
-        raw_body = req.get_body().decode('utf-8')
-        logging.info("Raw request body: %s", raw_body)
-        req_body = json.loads(raw_body)
-        logging.info("Request payload: %s", json.dumps(req_body, indent=2))
+        req_body = json.loads(req.get_body().decode('utf-8'))
     except ValueError:
-        logging.error("Invalid request body")
+        logging.debug("Invalid request body")
         return None, "Invalid request body", 400
 
-    subscription_id = req_body.get("subscriptionId")
-    deployment_id = req_body.get("deploymentId")
-    response_body = req_body.get("responseBody", {})
-    model = response_body.get("model")
-    object_type = response_body.get("object")
-    usage = response_body.get("usage", {})
-    completion_tokens = usage.get("completion_tokens", 0)
-    prompt_tokens = usage.get("prompt_tokens", 0)
-    total_tokens = usage.get("total_tokens", 0)
-
-    if not all([subscription_id, deployment_id, model, object_type]):
-        logging.error("Missing required fields")
-        return None, "Missing required fields", 400
-
-    log_data = {
-        "subscriptionId": subscription_id,
-        "deploymentId": deployment_id,
-        "model": model,
-        "object": object_type,
-        "completionTokens": completion_tokens,
-        "promptTokens": prompt_tokens,
-        "totalTokens": total_tokens,
-    }
+    log_data, error_message = parse_usage_payload(req_body)
+    if error_message:
+        logging.debug(error_message)
+        return None, error_message, 400
 
     return log_data, None, None
 
 def update_redis_cache(redis_client, cache_key, log_data):
-    """Update the Redis cache with the new log data."""
-    try:
-        existing_value = redis_client.get(cache_key)
+    """
+    Update the Redis cache with the new log data.
+
+    The read and the write happen in a WATCH/MULTI transaction that is
+    retried if another writer (another function instance or the replay
+    tool) touches the key in between, so no increment is lost.
+    """
+    new_usage = {field: log_data[field] for field in TOKEN_FIELDS}
+
+    def apply(pipe):
+        log_data.update(new_usage)
+        existing_value = pipe.get(cache_key)
         if existing_value:
-            existing_data = json.loads(existing_value)
-            log_data["completionTokens"] += existing_data.get("completionTokens", 0)
-            log_data["promptTokens"] += existing_data.get("promptTokens", 0)
-            log_data["totalTokens"] += existing_data.get("totalTokens", 0)
-
-        cache_value = json.dumps(log_data)
-        redis_client.setex(cache_key, 86400, cache_value)
-        logging.info("Data cached in Redis successfully")
-        logging.info(f"Cache key: {cache_key}")
-        logging.info(f"Cache value: {cache_value}")
+            existing_data = decode_usage(cache_key, existing_value)
+            for field in TOKEN_FIELDS:
+                log_data[field] += existing_data.get(field, 0)
+
+        cache_value = encode_usage(log_data)
+        pipe.multi()
+        pipe.setex(cache_key, 86400, cache_value)
+        logging.debug("Cached %d bytes in Redis under key %s", len(cache_value), cache_key)
+
+    try:
+        redis_client.transaction(apply, cache_key)
     except redis.RedisError as e:
         logging.error("Failed to interact with Redis: %s", e)
         return "Failed to process log data", 500
+    except (ValueError, TypeError) as e:
+        # TypeError covers legacy JSON values with non-integer token counts.
+        logging.error("Failed to encode or decode usage record: %s", e)
+        return "Failed to process log data", 500
 
     return None, None
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    """Main function to process the HTTP request, store log data in Redis, and log the stored data."""
-    logging.info("Python HTTP trigger function processed a request.")
-
-    # Calculate the size of the request payload and headers
-    request_payload_size = len(req.get_body())
-    request_headers_size = sum(len(k) + len(v) for k, v in req.headers.items())
-    total_request_size = request_payload_size + request_headers_size
-
-    logging.info(f"Request payload size: {request_payload_size} bytes")
-    logging.info(f"Request headers size: {request_headers_size} bytes")
-    logging.info(f"Total request size: {total_request_size} bytes")
+def _headers_size(headers):
+    return sum(len(k) + len(v) for k, v in headers.items())
 
+def _process(req):
+    """Parse the request and store it in Redis, returning the response and log data."""
     log_data, error_message, status_code = parse_request(req)
     if error_message:
-        return func.HttpResponse(error_message, status_code=status_code)
+        return func.HttpResponse(error_message, status_code=status_code), None
 
     redis_client = get_redis_client()
-    cache_key = f"{log_data['subscriptionId']}-{log_data['deploymentId']}"
+    cache_key = make_cache_key(log_data['subscriptionId'], log_data['deploymentId'])
 
     error_message, status_code = update_redis_cache(redis_client, cache_key, log_data)
     if error_message:
-        return func.HttpResponse(error_message, status_code=status_code)
-
-    # Calculate the size of the response payload and headers
-    response_payload = json.dumps(log_data).encode('utf-8')
-    response_payload_size = len(response_payload)
-    response_headers = {
-        "Content-Type": "application/json",
-        "Content-Length": str(response_payload_size)
-    }
-    response_headers_size = sum(len(k) + len(v) for k, v in response_headers.items())
-    total_response_size = response_payload_size + response_headers_size
-
-    logging.info(f"Response payload size: {response_payload_size} bytes")
-    logging.info(f"Response headers size: {response_headers_size} bytes")
-    logging.info(f"Total response size: {total_response_size} bytes")
-
-    # Log the total size (request + response)
-    total_size = total_request_size + total_response_size
-    logging.info(f"Total size (request + response): {total_size} bytes")
-
-    # Log the stored data to the function app's log stream
-    logging.info("Stored log data: %s", json.dumps(log_data, indent=2))
-    return func.HttpResponse("Log data processed and stored successfully", status_code=200)
\ No newline at end of file
+        return func.HttpResponse(error_message, status_code=status_code), log_data
+
+    return func.HttpResponse("Log data processed and stored successfully", status_code=200), log_data
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    """Main function to process the HTTP request, store log data in Redis, and log a sampled request event."""
+    started = time.monotonic()
+    sampled = request_logger.sample()
+
+    response = log_data = None
+    try:
+        response, log_data = _process(req)
+        return response
+    finally:
+        # Requests that raise are recorded as 500s, which are always sampled.
+        request_logger.finish(
+            sampled,
+            status_code=response.status_code if response is not None else 500,
+            duration_ms=(time.monotonic() - started) * 1000,
+            request_size=len(req.get_body()) + _headers_size(req.headers),
+            response_size=len(response.get_body()) + _headers_size(response.headers) if response is not None else 0,
+            **(log_data or {}),
+        )
@@ -0,0 +1,216 @@
+"""
+Sampled, structured request logging with payload-size analytics.
+
+Logging request and response details on every call costs CPU and
+log-ingest volume in proportion to traffic. `RequestLogger` instead:
+
+- records every request's payload sizes into in-memory histograms that are
+  emitted as a single `payload_sizes` event by the first request to finish
+  at least `emit_interval` seconds after the previous one, or by `flush`
+  (there is no background timer, so an idle worker emits nothing until
+  its next request or its `atexit` flush);
+- head-samples a fraction of requests for a structured `request` event;
+- tail-samples failed and slow requests so they are always considered;
+- rate-limits emitted events with a token bucket, counting what it drops.
+
+Events are single-line JSON built only from the allowlisted fields in
+`EVENT_FIELDS`, so request bodies and prompts are never serialized.
+
+Configuration is read from the environment by `RequestLogger.from_env`;
+malformed values fall back to the defaults with a warning:
+
+    LOG_SAMPLE_RATE              fraction of requests head-sampled (0.01)
+    LOG_MAX_EVENTS_PER_SECOND    request event rate limit, 0 disables (10)
+    LOG_SLOW_REQUEST_MS          duration that triggers tail sampling (1000)
+    LOG_HISTOGRAM_INTERVAL       seconds between histogram events (60)
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+EVENT_FIELDS = frozenset({
+    "subscriptionId",
+    "deploymentId",
+    "model",
+    "object",
+    "statusCode",
+    "durationMs",
+    "requestSize",
+    "responseSize",
+    "sampledBy",
+})
+
+
+class PayloadSizeHistogram:
+    """Histogram of payload sizes in power-of-two byte buckets."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Clear all recorded sizes."""
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, size):
+        """Record a payload size in bytes."""
+        upper_bound = 1 << max(size - 1, 0).bit_length()
+        self.buckets[upper_bound] = self.buckets.get(upper_bound, 0) + 1
+        self.count += 1
+        self.total += size
+        if size > self.max:
+            self.max = size
+
+    def snapshot(self):
+        """Return the histogram as a JSON-serializable dict."""
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            "buckets": {f"le_{bound}": n for bound, n in sorted(self.buckets.items())},
+        }
+
+
+class TokenBucket:
+    """Token bucket rate limiter."""
+
+    def __init__(self, rate, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._last = clock()
+
+    def try_acquire(self):
+        """Take a token if one is available and report whether it was taken."""
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logging.getLogger(__name__).warning(
+            "Invalid value %r for %s, using default %s", value, name, default)
+        return default
+
+
+class RequestLogger:
+    """
+    Structured, sampled request event logger with payload-size histograms.
+
+    Safe to share between the threads of a sync function worker.
+    """
+
+    def __init__(self, sample_rate=0.01, max_events_per_second=10.0, slow_request_ms=1000.0,
+                 emit_interval=60.0, logger=None, clock=time.monotonic, rng=random.random):
+        self.sample_rate = sample_rate
+        self.slow_request_ms = slow_request_ms
+        self.emit_interval = emit_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.request_sizes = PayloadSizeHistogram()
+        self.response_sizes = PayloadSizeHistogram()
+        self.dropped_events = 0
+        self._limiter = TokenBucket(max_events_per_second, clock) if max_events_per_second > 0 else None
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._rng = rng
+        self._last_emit = clock()
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Create a logger configured from `LOG_*` environment variables."""
+        return cls(
+            sample_rate=_env_float("LOG_SAMPLE_RATE", 0.01),
+            max_events_per_second=_env_float("LOG_MAX_EVENTS_PER_SECOND", 10.0),
+            slow_request_ms=_env_float("LOG_SLOW_REQUEST_MS", 1000.0),
+            emit_interval=_env_float("LOG_HISTOGRAM_INTERVAL", 60.0),
+            **kwargs,
+        )
+
+    def sample(self):
+        """Make the head sampling decision for a new request."""
+        return self._rng() < self.sample_rate
+
+    def finish(self, sampled, status_code, duration_ms, request_size, response_size, **fields):
+        """
+        Record a completed request.
+
+        Sizes always go into the histograms, which are emitted here if
+        `emit_interval` has elapsed. A `request` event is emitted only
+        if the request was head-sampled, failed, or was slow, and the rate
+        limit allows it. Fields outside `EVENT_FIELDS` are dropped.
+        """
+        if status_code >= 400:
+            sampled_by = "error"
+        elif duration_ms >= self.slow_request_ms:
+            sampled_by = "slow"
+        elif sampled:
+            sampled_by = "head"
+        else:
+            sampled_by = None
+        emit_event = (sampled_by is not None and self._limiter is not None
+                      and self.logger.isEnabledFor(logging.INFO))
+
+        with self._lock:
+            self.request_sizes.record(request_size)
+            self.response_sizes.record(response_size)
+            histograms = None
+            if self._clock() - self._last_emit >= self.emit_interval:
+                histograms = self._take_histograms()
+            if emit_event and not self._limiter.try_acquire():
+                self.dropped_events += 1
+                emit_event = False
+
+        if histograms:
+            self._emit("payload_sizes", histograms)
+        if not emit_event:
+            return
+
+        event = {k: v for k, v in fields.items() if k in EVENT_FIELDS}
+        event.update(
+            statusCode=status_code,
+            durationMs=round(duration_ms, 1),
+            requestSize=request_size,
+            responseSize=response_size,
+            sampledBy=sampled_by,
+        )
+        self._emit("request", event)
+
+    def flush(self):
+        """Emit the payload-size histograms now and start a new interval."""
+        with self._lock:
+            histograms = self._take_histograms()
+        self._emit("payload_sizes", histograms)
+
+    def _take_histograms(self):
+        # Called with the lock held.
+        histograms = {
+            "intervalSeconds": round(self._clock() - self._last_emit, 1),
+            "request": self.request_sizes.snapshot(),
+            "response": self.response_sizes.snapshot(),
+            "droppedEvents": self.dropped_events,
+        }
+        self.request_sizes.reset()
+        self.response_sizes.reset()
+        self.dropped_events = 0
+        self._last_emit = self._clock()
+        return histograms
+
+    def _emit(self, event_name, payload):
+        self.logger.info(json.dumps({"event": event_name, **payload}, separators=(",", ":")))
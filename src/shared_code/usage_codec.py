@@ -0,0 +1,119 @@
+"""
+Compact, versioned encoding for the usage records stored in Redis.
+
+Usage records used to be stored as JSON strings that repeated every field
+name as well as the subscription and deployment IDs that are already part
+of the cache key. This module packs a record into a fixed-layout binary
+value instead and is shared by the `process_logs` function and the backend
+app, so both sides agree on the layout.
+
+Layout of a version 1 value (network byte order):
+
+    B   format version (1)
+    Q   completion tokens
+    Q   prompt tokens
+    Q   total tokens
+    H   length of the subscription ID in the cache key, in bytes
+    B   length of the model name, followed by the UTF-8 model name
+    B   length of the object type, followed by the UTF-8 object type
+
+The subscription ID length is what makes the key `<subscription>-<deployment>`
+splittable, since both IDs may themselves contain hyphens.
+
+Values written before this format existed are JSON objects and are still
+decoded transparently, so existing keys keep working until they expire.
+"""
+
+import json
+import struct
+
+FORMAT_VERSION = 1
+
+# Largest model name or object type, in UTF-8 bytes, that the layout can hold.
+MAX_STR_FIELD_BYTES = 255
+# Largest subscription ID, in UTF-8 bytes, that the layout can hold.
+MAX_SUBSCRIPTION_ID_BYTES = 65535
+
+_HEADER = struct.Struct("!BQQQH")
+_LENGTH = struct.Struct("!B")
+
+
+def make_cache_key(subscription_id, deployment_id):
+    """Build the Redis key for a subscription and deployment pair."""
+    return f"{subscription_id}-{deployment_id}"
+
+
+def _pack_str(value):
+    data = value.encode("utf-8")
+    if len(data) > MAX_STR_FIELD_BYTES:
+        raise ValueError(f"Value too long to encode: {value!r}")
+    return _LENGTH.pack(len(data)) + data
+
+
+def _unpack_str(buf, offset):
+    (length,) = _LENGTH.unpack_from(buf, offset)
+    offset += _LENGTH.size
+    if offset + length > len(buf):
+        raise struct.error("buffer too short for string field")
+    return buf[offset:offset + length].decode("utf-8"), offset + length
+
+
+def encode_usage(log_data):
+    """
+    Encode a usage record dict into its compact binary representation.
+
+    Raises `ValueError` if a token count is not a non-negative integer that
+    fits the layout, or if a string field is too long.
+    """
+    subscription_length = len(log_data["subscriptionId"].encode("utf-8"))
+    try:
+        header = _HEADER.pack(
+            FORMAT_VERSION,
+            log_data.get("completionTokens", 0),
+            log_data.get("promptTokens", 0),
+            log_data.get("totalTokens", 0),
+            subscription_length,
+        )
+    except struct.error as e:
+        raise ValueError(f"Cannot encode usage record: {e}") from e
+    return header + _pack_str(log_data["model"]) + _pack_str(log_data["object"])
+
+
+def decode_usage(cache_key, value):
+    """
+    Decode a stored usage record back into the dict shape used throughout
+    the function app and backend.
+
+    `cache_key` and `value` may be given as `str` or `bytes`. Legacy JSON
+    values are returned as-is. Raises `ValueError` if the value cannot be
+    decoded.
+    """
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    if isinstance(cache_key, bytes):
+        cache_key = cache_key.decode("utf-8")
+
+    if value[:1] == b"{":
+        return json.loads(value)
+
+    try:
+        version, completion, prompt, total, subscription_length = _HEADER.unpack_from(value)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported usage record version: {version}")
+        model, offset = _unpack_str(value, _HEADER.size)
+        object_type, _ = _unpack_str(value, offset)
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Malformed usage record: {e}") from e
+
+    key_bytes = cache_key.encode("utf-8")
+    if key_bytes[subscription_length:subscription_length + 1] != b"-":
+        raise ValueError(f"Usage record does not match cache key {cache_key!r}")
+    return {
+        "subscriptionId": key_bytes[:subscription_length].decode("utf-8"),
+        "deploymentId": key_bytes[subscription_length + 1:].decode("utf-8"),
+        "model": model,
+        "object": object_type,
+        "completionTokens": completion,
+        "promptTokens": prompt,
+        "totalTokens": total,
+    }
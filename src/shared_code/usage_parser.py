@@ -0,0 +1,67 @@
+"""
+Extraction of usage records from the log payloads APIM sends to the function.
+
+Shared by the `process_logs` function and the offline replay tool, so that
+recorded events are parsed exactly like live ones. Every record it accepts
+can be stored with `shared_code.usage_codec`.
+"""
+
+from shared_code.usage_codec import MAX_STR_FIELD_BYTES, MAX_SUBSCRIPTION_ID_BYTES
+
+TOKEN_FIELDS = ("completionTokens", "promptTokens", "totalTokens")
+
+
+def _is_token_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _is_short_str(value, max_bytes):
+    return isinstance(value, str) and len(value.encode("utf-8")) <= max_bytes
+
+
+def parse_usage_payload(req_body):
+    """
+    Extract the usage record from a decoded request body.
+
+    Returns a `(log_data, error_message)` tuple where exactly one is `None`.
+    """
+    if not isinstance(req_body, dict):
+        return None, "Invalid request body"
+
+    subscription_id = req_body.get("subscriptionId")
+    deployment_id = req_body.get("deploymentId")
+    response_body = req_body.get("responseBody", {})
+    if not isinstance(response_body, dict):
+        return None, "Invalid request body"
+    model = response_body.get("model")
+    object_type = response_body.get("object")
+    usage = response_body.get("usage", {})
+    if not isinstance(usage, dict):
+        return None, "Invalid usage fields"
+    completion_tokens = usage.get("completion_tokens", 0)
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    total_tokens = usage.get("total_tokens", 0)
+
+    if not all([subscription_id, deployment_id, model, object_type]):
+        return None, "Missing required fields"
+
+    if not (isinstance(deployment_id, str)
+            and _is_short_str(subscription_id, MAX_SUBSCRIPTION_ID_BYTES)
+            and _is_short_str(model, MAX_STR_FIELD_BYTES)
+            and _is_short_str(object_type, MAX_STR_FIELD_BYTES)):
+        return None, "Invalid usage fields"
+
+    if not all(_is_token_count(n) for n in (completion_tokens, prompt_tokens, total_tokens)):
+        return None, "Invalid usage fields"
+
+    log_data = {
+        "subscriptionId": subscription_id,
+        "deploymentId": deployment_id,
+        "model": model,
+        "object": object_type,
+        "completionTokens": completion_tokens,
+        "promptTokens": prompt_tokens,
+        "totalTokens": total_tokens,
+    }
+
+    return log_data, None
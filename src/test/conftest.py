@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the function app's packages importable when pytest runs from the repo root.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
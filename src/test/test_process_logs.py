@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+pytest.importorskip("redis")
+pytest.importorskip("azure.functions")
+pytest.importorskip("azure.identity")
+pytest.importorskip("azure.mgmt.redis")
+
+from process_logs import parse_request, update_redis_cache  # noqa: E402
+from shared_code.usage_codec import decode_usage, encode_usage  # noqa: E402
+
+
+class StubRequest:
+    def __init__(self, body):
+        self._body = json.dumps(body).encode("utf-8")
+
+    def get_body(self):
+        return self._body
+
+
+class StubPipeline:
+    def __init__(self, store):
+        self.store = store
+        self.writes = []
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def multi(self):
+        pass
+
+    def setex(self, key, ttl, value):
+        self.writes.append((key, value))
+
+
+class StubRedis:
+    def __init__(self, store=None):
+        self.store = store or {}
+
+    def transaction(self, func, *keys):
+        pipe = StubPipeline(self.store)
+        func(pipe)
+        self.store.update(pipe.writes)
+
+
+def make_body(**response_overrides):
+    response_body = {
+        "model": "gpt-4o",
+        "object": "chat.completion",
+        "usage": {"completion_tokens": 1, "prompt_tokens": 2, "total_tokens": 3},
+    }
+    response_body.update(response_overrides)
+    return {"subscriptionId": "sub-1", "deploymentId": "gpt-4o", "responseBody": response_body}
+
+
+@pytest.mark.parametrize("overrides", [
+    {"model": 5},
+    {"model": "m" * 256},
+    {"usage": None},
+    {"usage": {"completion_tokens": 1.5}},
+])
+def test_parse_request_rejects_unstorable_records(overrides):
+    log_data, error_message, status_code = parse_request(StubRequest(make_body(**overrides)))
+    assert log_data is None
+    assert status_code == 400
+
+
+def test_parse_request_rejects_null_response_body():
+    body = make_body()
+    body["responseBody"] = None
+    assert parse_request(StubRequest(body))[2] == 400
+
+
+def test_update_redis_cache_adds_to_existing_value():
+    log_data, _, _ = parse_request(StubRequest(make_body()))
+    client = StubRedis({"sub-1-gpt-4o": encode_usage(dict(log_data, totalTokens=10))})
+    assert update_redis_cache(client, "sub-1-gpt-4o", log_data) == (None, None)
+    assert decode_usage("sub-1-gpt-4o", client.store["sub-1-gpt-4o"])["totalTokens"] == 13
+
+
+def test_update_redis_cache_reports_corrupt_legacy_value():
+    log_data, _, _ = parse_request(StubRequest(make_body()))
+    client = StubRedis({"sub-1-gpt-4o": json.dumps({"totalTokens": "10"})})
+    assert update_redis_cache(client, "sub-1-gpt-4o", log_data) == ("Failed to process log data", 500)
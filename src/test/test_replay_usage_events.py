@@ -0,0 +1,175 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "scripts"))
+
+import replay_usage_events as replay  # noqa: E402
+from shared_code.usage_codec import decode_usage, encode_usage  # noqa: E402
+
+
+def make_body(subscription_id="sub-1", deployment_id="gpt-4o", model="gpt-4o", total_tokens=3, **usage):
+    return {
+        "subscriptionId": subscription_id,
+        "deploymentId": deployment_id,
+        "responseBody": {
+            "model": model,
+            "object": "chat.completion",
+            "usage": {"completion_tokens": 1, "prompt_tokens": 2, "total_tokens": total_tokens, **usage},
+        },
+    }
+
+
+def make_record(subscription_id="sub-1", deployment_id="gpt-4o", **overrides):
+    record = {
+        "subscriptionId": subscription_id,
+        "deploymentId": deployment_id,
+        "model": "gpt-4o",
+        "object": "chat.completion",
+        "completionTokens": 1,
+        "promptTokens": 2,
+        "totalTokens": 3,
+    }
+    record.update(overrides)
+    return record
+
+
+def ndjson(*bodies):
+    return [(b if isinstance(b, bytes) else json.dumps(b).encode("utf-8")) + b"\n" for b in bodies]
+
+
+class StubPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def mget(self, keys):
+        return [self.client.store.get(k) for k in keys]
+
+    def multi(self):
+        pass
+
+    def set(self, key, value, ex=None):
+        self.writes.append((key, value))
+
+    def execute(self):
+        self.client.store.update(self.writes)
+        self.writes = []
+
+
+class StubRedis:
+    """Just enough of a redis client; `conflicts` simulates WatchError retries."""
+
+    def __init__(self, store=None, conflicts=0):
+        self.store = dict(store or {})
+        self.conflicts = conflicts
+        self.attempts = 0
+
+    def pipeline(self, transaction=True):
+        return StubPipeline(self)
+
+    def transaction(self, func, *keys):
+        while True:
+            self.attempts += 1
+            pipe = StubPipeline(self)
+            func(pipe)
+            if self.conflicts:
+                self.conflicts -= 1
+                continue
+            pipe.execute()
+            return
+
+
+def test_merge_record_sums_tokens_and_keeps_latest_model():
+    aggregates = {}
+    replay.merge_record(aggregates, make_record(model="gpt-4o"))
+    replay.merge_record(aggregates, make_record(model="gpt-4o-2024", totalTokens=10))
+    assert aggregates == {"sub-1-gpt-4o": make_record(
+        model="gpt-4o-2024", completionTokens=2, promptTokens=4, totalTokens=13)}
+
+
+def test_merge_record_does_not_alias_input():
+    aggregates = {}
+    record = make_record()
+    replay.merge_record(aggregates, record)
+    replay.merge_record(aggregates, make_record())
+    assert record["totalTokens"] == 3
+
+
+def test_aggregate_chunk_counts_invalid_lines():
+    lines = ndjson(
+        make_body(),
+        b"not json",
+        make_body(completion_tokens="1"),
+        make_body(completion_tokens=1.5),
+        make_body(model="m" * 256),
+        make_body(model=5),
+        {"subscriptionId": "sub-1", "deploymentId": "gpt-4o", "responseBody": None},
+        [1, 2],
+        make_body(total_tokens=7),
+    ) + [b"\n", b"   \n"]
+    aggregates, events, invalid = replay.aggregate_chunk(lines)
+    assert (events, invalid) == (9, 7)
+    assert aggregates["sub-1-gpt-4o"]["totalTokens"] == 10
+
+
+def test_aggregate_events_merges_chunks_in_input_order(tmp_path):
+    path = tmp_path / "events.ndjson"
+    bodies = [make_body(model=f"model-{i}", total_tokens=i) for i in range(50)]
+    bodies.insert(10, {"bad": "record"})
+    path.write_bytes(b"".join(ndjson(*bodies)) + b"garbage\n")
+
+    totals, events, invalid = replay.aggregate_events([str(path)], workers=2, chunk_size=3)
+
+    assert (events, invalid) == (52, 2)
+    assert totals["sub-1-gpt-4o"]["totalTokens"] == sum(range(50))
+    assert totals["sub-1-gpt-4o"]["model"] == "model-49"
+
+
+def test_replace_mode_skips_keys_that_fail_to_encode():
+    totals = {
+        "sub-1-gpt-4o": make_record(),
+        "sub-2-gpt-4o": make_record("sub-2", model="m" * 256),
+        "sub-3-gpt-4o": make_record("sub-3", model=5),
+        "sub-4-gpt-4o": make_record("sub-4"),
+    }
+    client = StubRedis({"sub-1-gpt-4o": encode_usage(make_record(totalTokens=100))})
+
+    assert replay.load_into_redis(client, totals, "replace", 60, 2) == (2, 2)
+    assert decode_usage("sub-1-gpt-4o", client.store["sub-1-gpt-4o"])["totalTokens"] == 3
+    assert "sub-4-gpt-4o" in client.store
+    assert "sub-2-gpt-4o" not in client.store
+
+
+def test_increment_mode_adds_to_existing_and_skips_corrupt_values():
+    totals = {
+        "sub-1-gpt-4o": make_record(),
+        "sub-2-gpt-4o": make_record("sub-2"),
+        "sub-3-gpt-4o": make_record("sub-3"),
+    }
+    client = StubRedis({
+        "sub-1-gpt-4o": encode_usage(make_record(totalTokens=100)),
+        "sub-2-gpt-4o": b"\x09corrupt",
+    })
+
+    assert replay.load_into_redis(client, totals, "increment", 60, 10) == (2, 1)
+    assert decode_usage("sub-1-gpt-4o", client.store["sub-1-gpt-4o"])["totalTokens"] == 103
+    assert client.store["sub-2-gpt-4o"] == b"\x09corrupt"
+    assert decode_usage("sub-3-gpt-4o", client.store["sub-3-gpt-4o"])["totalTokens"] == 3
+
+
+def test_increment_batch_retries_without_double_counting():
+    batch = [("sub-1-gpt-4o", make_record())]
+    client = StubRedis({"sub-1-gpt-4o": encode_usage(make_record(totalTokens=100))}, conflicts=2)
+
+    assert replay.increment_batch(client, batch, 60) == []
+    assert client.attempts == 3
+    assert decode_usage("sub-1-gpt-4o", client.store["sub-1-gpt-4o"])["totalTokens"] == 103
+    assert batch[0][1]["totalTokens"] == 3
+
+
+@pytest.mark.parametrize("mode", ["replace", "increment"])
+def test_load_into_redis_handles_empty_totals(mode):
+    assert replay.load_into_redis(StubRedis(), {}, mode, 60, 10) == (0, 0)
@@ -0,0 +1,115 @@
+import json
+import logging
+import threading
+
+import pytest
+
+from shared_code.request_logging import PayloadSizeHistogram, RequestLogger
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_logger(clock, **kwargs):
+    kwargs.setdefault("sample_rate", 0.0)
+    kwargs.setdefault("emit_interval", 60.0)
+    return RequestLogger(clock=clock, logger=logging.getLogger("test.request_logging"), **kwargs)
+
+
+def events(caplog, name):
+    parsed = [json.loads(r.getMessage()) for r in caplog.records if r.name == "test.request_logging"]
+    return [e for e in parsed if e["event"] == name]
+
+
+def test_histogram_buckets_by_power_of_two():
+    histogram = PayloadSizeHistogram()
+    for size in (0, 1, 2, 3, 1024, 1025):
+        histogram.record(size)
+    assert histogram.snapshot() == {
+        "count": 6,
+        "sum": 2055,
+        "max": 1025,
+        "buckets": {"le_1": 2, "le_2": 1, "le_4": 1, "le_1024": 1, "le_2048": 1},
+    }
+
+
+def test_unsampled_success_is_not_logged(caplog, clock):
+    caplog.set_level(logging.INFO)
+    request_logger = make_logger(clock)
+    request_logger.finish(False, 200, 5.0, 100, 10)
+    assert events(caplog, "request") == []
+    assert request_logger.request_sizes.count == 1
+
+
+def test_errors_are_logged_without_unlisted_fields(caplog, clock):
+    caplog.set_level(logging.INFO)
+    request_logger = make_logger(clock)
+    request_logger.finish(False, 500, 5.0, 100, 10, subscriptionId="sub", prompt="secret")
+    [event] = events(caplog, "request")
+    assert event["sampledBy"] == "error"
+    assert event["subscriptionId"] == "sub"
+    assert "prompt" not in event
+
+
+def test_rate_limit_drops_and_counts_events(caplog, clock):
+    caplog.set_level(logging.INFO)
+    request_logger = make_logger(clock, max_events_per_second=2)
+    for _ in range(5):
+        request_logger.finish(True, 200, 5.0, 100, 10)
+    assert len(events(caplog, "request")) == 2
+    request_logger.flush()
+    [histograms] = events(caplog, "payload_sizes")
+    assert histograms["droppedEvents"] == 3
+    assert histograms["request"]["count"] == 5
+
+
+def test_zero_rate_limit_disables_request_events(caplog, clock):
+    caplog.set_level(logging.INFO)
+    request_logger = make_logger(clock, max_events_per_second=0)
+    request_logger.finish(True, 500, 5.0, 100, 10)
+    assert events(caplog, "request") == []
+
+
+def test_histograms_are_emitted_each_interval(caplog, clock):
+    caplog.set_level(logging.INFO)
+    request_logger = make_logger(clock, emit_interval=10)
+    request_logger.finish(False, 200, 5.0, 100, 10)
+    clock.now = 10.0
+    request_logger.finish(False, 200, 5.0, 100, 10)
+    [histograms] = events(caplog, "payload_sizes")
+    assert histograms["request"]["count"] == 2
+    assert request_logger.request_sizes.count == 0
+
+
+def test_concurrent_finish_records_every_request(clock):
+    request_logger = make_logger(clock)
+
+    def worker():
+        for _ in range(1000):
+            request_logger.finish(False, 200, 5.0, 100, 10)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert request_logger.request_sizes.count == 8000
+
+
+def test_from_env_falls_back_on_malformed_values(monkeypatch, caplog):
+    monkeypatch.setenv("LOG_SAMPLE_RATE", "ten percent")
+    monkeypatch.setenv("LOG_MAX_EVENTS_PER_SECOND", "5")
+    request_logger = RequestLogger.from_env()
+    assert request_logger.sample_rate == 0.01
+    assert request_logger._limiter.rate == 5.0
+    assert "LOG_SAMPLE_RATE" in caplog.text
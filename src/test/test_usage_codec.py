@@ -0,0 +1,89 @@
+import json
+import struct
+
+import pytest
+
+from shared_code.usage_codec import FORMAT_VERSION, decode_usage, encode_usage, make_cache_key
+
+
+def make_record(**overrides):
+    record = {
+        "subscriptionId": "3f2b9c1e-8d4a-4b7e-9a61-0c5d2e7f4a18",
+        "deploymentId": "gpt-35-turbo-instruct",
+        "model": "gpt-35-turbo-instruct",
+        "object": "chat.completion",
+        "completionTokens": 12,
+        "promptTokens": 34,
+        "totalTokens": 46,
+    }
+    record.update(overrides)
+    return record
+
+
+def key_for(record):
+    return make_cache_key(record["subscriptionId"], record["deploymentId"])
+
+
+def test_round_trip_with_hyphenated_ids():
+    record = make_record()
+    assert decode_usage(key_for(record), encode_usage(record)) == record
+
+
+def test_round_trip_accepts_bytes_key_and_large_counts():
+    record = make_record(subscriptionId="sub-é", totalTokens=2**40)
+    key = key_for(record).encode("utf-8")
+    assert decode_usage(key, encode_usage(record)) == record
+
+
+def test_encoding_is_smaller_than_json():
+    record = make_record()
+    assert len(encode_usage(record)) < len(json.dumps(record))
+
+
+def test_legacy_json_value_is_decoded():
+    record = make_record()
+    assert decode_usage(key_for(record), json.dumps(record)) == record
+    assert decode_usage(key_for(record), json.dumps(record).encode("utf-8")) == record
+
+
+@pytest.mark.parametrize("tokens", [1.5, -1, None, "1", 2**64])
+def test_encode_rejects_invalid_token_counts(tokens):
+    with pytest.raises(ValueError):
+        encode_usage(make_record(completionTokens=tokens))
+
+
+def test_encode_rejects_overlong_strings():
+    with pytest.raises(ValueError):
+        encode_usage(make_record(model="m" * 256))
+
+
+def test_decode_rejects_wrong_version():
+    record = make_record()
+    value = bytearray(encode_usage(record))
+    value[0] = FORMAT_VERSION + 1
+    with pytest.raises(ValueError, match="version"):
+        decode_usage(key_for(record), bytes(value))
+
+
+@pytest.mark.parametrize("length", [0, 1, 10, 27, 30, -1])
+def test_decode_rejects_truncated_buffers(length):
+    record = make_record()
+    value = encode_usage(record)
+    with pytest.raises(ValueError):
+        decode_usage(key_for(record), value[:length])
+
+
+def test_decode_rejects_mismatched_key():
+    value = encode_usage(make_record())
+    with pytest.raises(ValueError, match="cache key"):
+        decode_usage("short-key", value)
+
+
+def test_decode_rejects_malformed_legacy_json():
+    with pytest.raises(ValueError):
+        decode_usage("sub-dep", "{not json")
+
+
+def test_header_layout_is_stable():
+    value = encode_usage(make_record())
+    assert struct.unpack_from("!BQQQH", value) == (FORMAT_VERSION, 12, 34, 46, 36)
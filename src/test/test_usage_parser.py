@@ -0,0 +1,94 @@
+import pytest
+
+from shared_code.usage_parser import parse_usage_payload
+
+
+def make_body(**usage):
+    return {
+        "subscriptionId": "sub-1",
+        "deploymentId": "gpt-4o",
+        "responseBody": {
+            "model": "gpt-4o",
+            "object": "chat.completion",
+            "usage": {"completion_tokens": 1, "prompt_tokens": 2, "total_tokens": 3, **usage},
+        },
+    }
+
+
+def test_parses_usage_record():
+    log_data, error_message = parse_usage_payload(make_body())
+    assert error_message is None
+    assert log_data == {
+        "subscriptionId": "sub-1",
+        "deploymentId": "gpt-4o",
+        "model": "gpt-4o",
+        "object": "chat.completion",
+        "completionTokens": 1,
+        "promptTokens": 2,
+        "totalTokens": 3,
+    }
+
+
+def test_missing_usage_defaults_to_zero():
+    body = make_body()
+    del body["responseBody"]["usage"]
+    log_data, error_message = parse_usage_payload(body)
+    assert error_message is None
+    assert log_data["totalTokens"] == 0
+
+
+@pytest.mark.parametrize("tokens", [1.5, -1, None, "1", True])
+def test_rejects_invalid_token_counts(tokens):
+    assert parse_usage_payload(make_body(completion_tokens=tokens)) == (None, "Invalid usage fields")
+
+
+def test_rejects_missing_fields():
+    body = make_body()
+    del body["subscriptionId"]
+    assert parse_usage_payload(body) == (None, "Missing required fields")
+
+
+def test_rejects_non_object_body():
+    assert parse_usage_payload([]) == (None, "Invalid request body")
+
+
+@pytest.mark.parametrize("field, value", [
+    ("subscriptionId", 5),
+    ("deploymentId", ["gpt-4o"]),
+])
+def test_rejects_non_string_ids(field, value):
+    body = make_body()
+    body[field] = value
+    assert parse_usage_payload(body) == (None, "Invalid usage fields")
+
+
+@pytest.mark.parametrize("field, value", [
+    ("model", 5),
+    ("object", {"type": "chat"}),
+    ("model", "m" * 256),
+    ("object", "é" * 128),
+])
+def test_rejects_model_and_object_the_codec_cannot_store(field, value):
+    body = make_body()
+    body["responseBody"][field] = value
+    assert parse_usage_payload(body) == (None, "Invalid usage fields")
+
+
+def test_accepts_model_at_the_length_limit():
+    body = make_body()
+    body["responseBody"]["model"] = "m" * 255
+    log_data, error_message = parse_usage_payload(body)
+    assert error_message is None
+    assert log_data["model"] == "m" * 255
+
+
+def test_rejects_null_response_body():
+    body = make_body()
+    body["responseBody"] = None
+    assert parse_usage_payload(body) == (None, "Invalid request body")
+
+
+def test_rejects_null_usage():
+    body = make_body()
+    body["responseBody"]["usage"] = None
+    assert parse_usage_payload(body) == (None, "Invalid usage fields")